@@ -4,39 +4,104 @@ Script de Transferência de Emails usando imapsync
 Transfere emails entre contas com logs detalhados do processo
 """
 
+import argparse
+import functools
 import json
 import subprocess
 import logging
+import multiprocessing
+import os
+import queue
+import re
+import shutil
+import socket
 import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
+from types import MappingProxyType
+from typing import Optional
+
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+try:
+    import dns.resolver
+except ImportError:
+    dns = None
 
 # Configuração de logs
 LOG_DIR = Path("logs")
 LOG_DIR.mkdir(exist_ok=True)
 
+# Cache do imapsync, reaproveitado entre execuções
+CACHE_DIR = LOG_DIR.parent / "imapsync_cache"
+CACHE_DIR.mkdir(exist_ok=True)
+
 # Nome do arquivo de log com timestamp
-log_filename = LOG_DIR / f"transfer_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
-
-# Configurar logging para arquivo e console
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler(log_filename, encoding="utf-8"),
-        logging.StreamHandler(sys.stdout),
-    ],
+started_at = datetime.now()
+log_filename = LOG_DIR / f"transfer_{started_at.strftime('%Y%m%d_%H%M%S')}.log"
+
+# Só o arquivo registra data/hora; no console, o custo de formatá-la a cada
+# linha não compensa
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+CONSOLE_LOG_FORMAT = "%(levelname)s - %(message)s"
+
+# Linha separadora dos blocos de log
+_BAR = "=" * 80
+
+# Tamanho do buffer dos pipes do imapsync (16 KiB)
+PIPE_BUFSIZE = 16384
+
+# Buffer de escrita do log bruto do imapsync (1 MiB)
+RAW_LOG_BUFSIZE = 1 << 20
+
+# Buffer de leitura padrão do imapsync (8 MiB)
+DEFAULT_BUFFERSIZE = 8 * 1024 * 1024
+
+# Opções do imapsync iguais para todas as contas
+_COMMON_OPTS = (
+    "--syncinternaldates",  # Preservar datas internas
+    "--syncacls",  # Sincronizar ACLs
+    "--subscribe",  # Inscrever nas pastas
+    "--nofoldersizes",  # Não calcular tamanhos (mais rápido)
+    "--useheader",
+    "Message-Id",  # Evitar duplicatas
+    "--useheader",
+    "Date",
+    "--no-modulesversion",  # Não verificar versões de módulos
+    "--noreleasecheck",  # Não verificar novas versões
+    "--tmpdir",  # Cache persistente: novas execuções só copiam mensagens novas
+    str(CACHE_DIR),
 )
 
-logger = logging.getLogger(__name__)
+# Só necessárias quando os servidores divergem no RFC822.SIZE
+_SIZE_MISMATCH_OPTS = (
+    "--skipsize",  # Pular verificação de tamanho
+    "--allowsizemismatch",  # Permitir diferenças de tamanho
+)
 
+# Linhas da saída do imapsync
+_PROGRESS_RE = re.compile(rb"^msg .*? copied to .*? (\d+\.\d+) msgs/s")
+_ERROR_RE = re.compile(
+    rb"^Err \d+/\d+|\b(?:ERROR|FAIL(?:ED|URE)?|NOT connected)\b", re.I
+)
+_SUMMARY_RE = re.compile(rb"^(?:Messages transferred|Total bytes transferred|Detected)")
 
-def get_imap_server_from_email(email):
-    """Tenta detectar o servidor IMAP baseado no domínio do email"""
-    domain = email.split("@")[-1].lower()
+# A cada quantas mensagens copiadas o progresso é registrado em INFO
+PROGRESS_EVERY = 100
 
-    # Servidores IMAP comuns
-    common_servers = {
+# Servidores IMAP comuns
+_IMAP_SERVERS = MappingProxyType(
+    {
         "gmail.com": "imap.gmail.com",
         "outlook.com": "outlook.office365.com",
         "hotmail.com": "outlook.office365.com",
@@ -45,35 +110,283 @@ def get_imap_server_from_email(email):
         "icloud.com": "imap.mail.me.com",
         "me.com": "imap.mail.me.com",
     }
+)
+
+# Tempo máximo (s) para testar a conexão com cada servidor IMAP
+PREFLIGHT_TIMEOUT = 10
 
-    if domain in common_servers:
-        return common_servers[domain]
+# Tentativas de conexão por servidor no teste (--preflight) e intervalo (s)
+PREFLIGHT_ATTEMPTS = 2
+PREFLIGHT_RETRY_DELAY = 2
 
-    # Para domínios personalizados, tenta mail.dominio ou imap.dominio
+# Tempo máximo (s) da consulta DNS do servidor IMAP de domínios personalizados
+DNS_TIMEOUT = 3
+
+# Limite padrão de transferências simultâneas
+DEFAULT_MAX_JOBS = 8
+
+logger = logging.getLogger(__name__)
+
+# Opções da execução atual, definidas no inicializador de cada worker
+_worker_options = {}
+
+
+def setup_logging(log_file, console_prefix=""):
+    """
+    Configura logging para arquivo e console, substituindo handlers anteriores
+
+    Os registros são apenas enfileirados por quem chama o logger; a formatação e
+    a escrita em arquivo/console ocorrem na thread do QueueListener retornado.
+    console_prefix identifica a origem das linhas no console, compartilhado
+    pelos workers que rodam em paralelo.
+    """
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+
+    file_handler = logging.FileHandler(log_file, encoding="utf-8")
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(
+        logging.Formatter(console_prefix.replace("%", "%%") + CONSOLE_LOG_FORMAT)
+    )
+    handlers = (file_handler, console_handler)
+
+    log_queue = queue.Queue(-1)
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(logging.INFO)
+
+    listener = QueueListener(log_queue, *handlers)
+    listener.start()
+    return listener
+
+
+def stop_logging(listener):
+    """Esvazia a fila de logs e volta a escrever diretamente nos handlers"""
+    listener.stop()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    for handler in listener.handlers:
+        root.addHandler(handler)
+
+
+@functools.lru_cache(maxsize=1024)
+def get_imap_server_from_email(email):
+    """Tenta detectar o servidor IMAP baseado no domínio do email"""
+    domain = email.rpartition("@")[2].lower()
+
+    return _IMAP_SERVERS.get(domain) or _resolve_imap(domain)
+
+
+@functools.lru_cache(maxsize=4096)
+def _resolve_imap(domain):
+    """
+    Detecta o servidor IMAP de um domínio personalizado
+
+    Consulta o registro SRV _imaps._tcp do domínio (RFC 6186) quando o dnspython
+    está instalado; sem ele, ou sem registro, usa mail.dominio.
+    """
+    if dns is not None:
+        try:
+            answer = dns.resolver.resolve(
+                f"_imaps._tcp.{domain}", "SRV", lifetime=DNS_TIMEOUT
+            )
+            record = min(answer, key=lambda r: (r.priority, -r.weight))
+            target = str(record.target).rstrip(".")
+            # Alvo "." indica que o domínio não oferece o serviço
+            if target:
+                return target
+        except Exception:
+            pass
     return f"mail.{domain}"
 
 
-def check_imapsync_installed():
-    """Verifica se o imapsync está instalado"""
+@dataclass(frozen=True)
+class Endpoint:
+    """Conta IMAP (origem ou destino) validada a partir do emails.json"""
+
+    email: str
+    senha: str
+    imap_server: Optional[str] = None
+    imap_port: int = 993
+    use_ssl: bool = True
+    provider: Optional[str] = None
+    buffersize: int = DEFAULT_BUFFERSIZE
+    allow_size_mismatch: bool = False
+
+    @property
+    def host(self):
+        """Servidor IMAP (personalizado ou auto-detectado)"""
+        return self.imap_server or get_imap_server_from_email(self.email)
+
+    @property
+    def is_gmail(self):
+        """Indica se a conta é do Gmail (pelo campo 'provider' ou pelo servidor)"""
+        return self.provider == "gmail" or self.host == "imap.gmail.com"
+
+
+def parse_endpoint(data, side):
+    """
+    Valida e normaliza um lado ('from' ou 'to') de uma conta do JSON
+
+    Levanta ValueError com a descrição do problema se os dados forem inválidos.
+    """
+    if not isinstance(data, dict):
+        raise ValueError(f"'{side}' ausente ou inválido")
+
+    missing = [field for field in ("email", "senha") if not data.get(field)]
+    if missing:
+        raise ValueError(f"'{side}' sem o(s) campo(s): {', '.join(missing)}")
+
+    email = str(data["email"])
     try:
-        result = subprocess.run(
-            ["imapsync", "--version"], capture_output=True, text=True, timeout=5
+        return Endpoint(
+            email=email,
+            senha=str(data["senha"]),
+            # Aceita tanto 'imap' quanto 'imap_server'; o servidor auto-detectado é
+            # resolvido aqui, para que os workers não repitam a consulta DNS
+            imap_server=(
+                data.get("imap")
+                or data.get("imap_server")
+                or get_imap_server_from_email(email)
+            ),
+            imap_port=int(data.get("imap_port", 993)),
+            use_ssl=bool(data.get("use_ssl", True)),
+            provider=data.get("provider"),
+            buffersize=int(data.get("buffersize", DEFAULT_BUFFERSIZE)),
+            allow_size_mismatch=bool(data.get("allow_size_mismatch", False)),
         )
-        logger.info(f"imapsync encontrado: {result.stdout.strip()}")
-        return True
-    except FileNotFoundError:
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"'{side}' com valor inválido: {e}") from e
+
+
+def validate_accounts(accounts):
+    """
+    Valida todas as contas de uma vez, antes de iniciar as transferências
+
+    Retorna (válidas, falhas): a lista de (índice, origem, destino) já
+    normalizados e a lista de registros de falha para o resumo final.
+    """
+    valid = []
+    failed = []
+    for idx, account in enumerate(accounts):
+        raw = account if isinstance(account, dict) else {}
+        try:
+            source = parse_endpoint(raw.get("from"), "from")
+            destination = parse_endpoint(raw.get("to"), "to")
+        except ValueError as e:
+            logger.warning(f"Conta {idx + 1} com dados inválidos ({e}), pulando...")
+            emails = [
+                side.get("email") if isinstance(side, dict) else None
+                for side in (raw.get("from"), raw.get("to"))
+            ]
+            failed.append(_failed_entry(idx, *emails, f"Dados inválidos no JSON: {e}"))
+            continue
+        valid.append((idx, source, destination))
+    return valid, failed
+
+
+def probe_imap_server(server):
+    """
+    Testa a conexão TCP com um servidor (host, porta); retorna o erro ou None
+
+    Faz até PREFLIGHT_ATTEMPTS tentativas, para que uma falha momentânea de rede
+    ou DNS não derrube todas as contas do servidor.
+    """
+    error = None
+    for attempt in range(PREFLIGHT_ATTEMPTS):
+        if attempt:
+            time.sleep(PREFLIGHT_RETRY_DELAY)
+        try:
+            with socket.create_connection(server, timeout=PREFLIGHT_TIMEOUT):
+                return None
+        except OSError as e:
+            error = str(e) or type(e).__name__
+    return error
+
+
+def check_servers(accounts):
+    """
+    Testa cada servidor IMAP distinto uma única vez, antes das transferências
+
+    Os servidores são testados em paralelo. Contas cujo servidor não responde
+    falham imediatamente, sem esperar o timeout de conexão do imapsync.
+    Retorna (acessíveis, falhas), no mesmo formato de validate_accounts.
+    """
+    servers = list(
+        dict.fromkeys(
+            (endpoint.host, endpoint.imap_port)
+            for _, source, destination in accounts
+            for endpoint in (source, destination)
+        )
+    )
+    logger.info(f"Testando conexão com {len(servers)} servidor(es) IMAP...")
+    with ThreadPoolExecutor(max_workers=min(16, len(servers))) as executor:
+        errors = dict(zip(servers, executor.map(probe_imap_server, servers)))
+
+    for (host, port), error in errors.items():
+        if error:
+            logger.error(f"Servidor inacessível: {host}:{port} ({error})")
+
+    reachable = []
+    failed = []
+    for entry in accounts:
+        idx, source, destination = entry
+        down = [
+            f"{host}:{port} ({errors[(host, port)]})"
+            for host, port in dict.fromkeys(
+                [
+                    (source.host, source.imap_port),
+                    (destination.host, destination.imap_port),
+                ]
+            )
+            if errors[(host, port)]
+        ]
+        if not down:
+            reachable.append(entry)
+            continue
+        failed.append(
+            _failed_entry(
+                idx,
+                source.email,
+                destination.email,
+                f"Servidor inacessível: {', '.join(down)}",
+            )
+        )
+    return reachable, failed
+
+
+def check_imapsync_installed(show_version=False):
+    """
+    Verifica se o imapsync está instalado
+
+    Retorna o caminho do executável, ou None se não for encontrado. A versão só
+    é consultada (executando o imapsync) quando show_version for verdadeiro.
+    """
+    path = shutil.which("imapsync")
+    if not path:
         logger.error("imapsync não encontrado. Instale com: brew install imapsync")
-        return False
-    except Exception as e:
-        logger.error(f"Erro ao verificar imapsync: {e}")
-        return False
+        return None
+    logger.info(f"imapsync encontrado: {path}")
+
+    if show_version:
+        try:
+            result = subprocess.run(
+                [path, "--version"], capture_output=True, text=True, timeout=5
+            )
+            logger.info(f"Versão do imapsync: {result.stdout.strip()}")
+        except Exception as e:
+            logger.error(f"Erro ao verificar imapsync: {e}")
+            return None
+    return path
 
 
 def load_email_accounts(json_file="emails.json"):
     """Carrega as contas de email do arquivo JSON"""
     try:
-        with open(json_file, "r", encoding="utf-8") as f:
-            accounts = json.load(f)
+        accounts = _json_loads(Path(json_file).read_bytes())
         logger.info(f"Carregadas {len(accounts)} conta(s) do arquivo {json_file}")
         return accounts
     except FileNotFoundError:
@@ -84,61 +397,114 @@ def load_email_accounts(json_file="emails.json"):
         return None
 
 
-def transfer_emails(source, destination, index=0, total=1):
+def _drain_stream(stream, log, prefix):
+    """Lê um pipe do subprocesso linha a linha, enviando cada linha ao log"""
+    with stream:
+        for line in stream:
+            line = line.decode("utf-8", "replace").strip()
+            if line:
+                log(f"{prefix}{line}")
+
+
+def _drain_imapsync_output(stream, raw_log):
     """
-    Transfere emails entre duas contas usando imapsync
+    Lê o stdout do imapsync, gravando-o sem alterações em raw_log
 
-    Args:
-        source: Dicionário com 'email', 'senha' e opcionalmente 'imap_server' e 'imap_port'
-        destination: Dicionário com 'email', 'senha' e opcionalmente 'imap_server' e 'imap_port'
-        index: Índice da transferência atual
-        total: Total de transferências
+    Só passam pelo logging um resumo do progresso a cada PROGRESS_EVERY
+    mensagens copiadas, as linhas de erro e o resumo final do imapsync.
     """
-    logger.info("=" * 80)
-    logger.info(f"Iniciando transferência {index + 1}/{total}")
-    logger.info(f"Origem: {source['email']}")
-    logger.info(f"Destino: {destination['email']}")
-    logger.info("=" * 80)
-
-    # Obter servidores IMAP (personalizado ou auto-detectado)
-    # Aceita tanto 'imap' quanto 'imap_server'
-    host1 = (
-        source.get("imap")
-        or source.get("imap_server")
-        or get_imap_server_from_email(source["email"])
-    )
-    host2 = (
-        destination.get("imap")
-        or destination.get("imap_server")
-        or get_imap_server_from_email(destination["email"])
-    )
+    copied = 0
+    with stream:
+        for line in stream:
+            raw_log.write(line)
+
+            match = _PROGRESS_RE.match(line)
+            if match:
+                copied += 1
+                if copied % PROGRESS_EVERY == 0:
+                    logger.info(
+                        f"imapsync: {copied} mensagens copiadas "
+                        f"({match.group(1).decode()} msgs/s)"
+                    )
+            elif _ERROR_RE.search(line):
+                logger.error(f"imapsync: {line.decode('utf-8', 'replace').strip()}")
+            elif _SUMMARY_RE.match(line):
+                logger.info(f"imapsync: {line.decode('utf-8', 'replace').strip()}")
+
+    if copied:
+        logger.info(f"imapsync: {copied} mensagens copiadas no total")
+
+
+def _run_piped(cmd, imapsync_log, pass_fds=()):
+    """
+    Executa o imapsync com a saída em pipes; retorna o código de saída
 
-    # Obter portas IMAP (padrão: 993 para SSL)
-    port1 = source.get("imap_port", 993)
-    port2 = destination.get("imap_port", 993)
+    O stdout completo vai para imapsync_log e o stderr para o log como aviso.
+    pass_fds são descritores herdados pelo imapsync (senhas).
+    """
+    with open(imapsync_log, "wb", buffering=RAW_LOG_BUFSIZE) as raw_log:
+        process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            bufsize=PIPE_BUFSIZE,
+            pass_fds=pass_fds,
+        )
 
-    # Verificar se deve usar SSL (padrão: sim)
-    use_ssl1 = source.get("use_ssl", True)
-    use_ssl2 = destination.get("use_ssl", True)
+        # Ler stdout e stderr em paralelo, para que nenhum dos pipes encha
+        # e bloqueie o imapsync
+        readers = [
+            threading.Thread(
+                target=_drain_imapsync_output,
+                args=(process.stdout, raw_log),
+                daemon=True,
+            ),
+            threading.Thread(
+                target=_drain_stream,
+                args=(process.stderr, logger.warning, "Avisos/Erros: "),
+                daemon=True,
+            ),
+        ]
+        for reader in readers:
+            reader.start()
 
-    logger.info(f"Servidor origem: {host1}:{port1} (SSL: {use_ssl1})")
-    logger.info(f"Servidor destino: {host2}:{port2} (SSL: {use_ssl2})")
+        # Aguardar conclusão
+        return_code = process.wait()
+        for reader in readers:
+            reader.join()
+    return return_code
+
+
+def _password_pipe(password):
+    """Cria um pipe anônimo já contendo a senha; retorna o descritor de leitura"""
+    read_fd, write_fd = os.pipe()
+    try:
+        os.write(write_fd, password.encode("utf-8"))
+    finally:
+        os.close(write_fd)
+    return read_fd
+
+
+def _build_cmd(source, destination, imapsync_bin="imapsync"):
+    """Monta a linha de comando do imapsync (sem as senhas) para um par de contas"""
+    host1 = source.host
+    host2 = destination.host
+    port1 = source.imap_port
+    port2 = destination.imap_port
 
     # Comando imapsync com opções detalhadas
     cmd = [
-        "imapsync",
+        imapsync_bin,
         "--host1",
         host1,
         "--port1",
         str(port1),
         "--user1",
-        source["email"],
-        "--password1",
-        source["senha"],
+        source.email,
     ]
 
     # Adicionar SSL se necessário
-    if use_ssl1:
+    if source.use_ssl:
         cmd.append("--ssl1")
 
     cmd.extend(
@@ -148,104 +514,257 @@ def transfer_emails(source, destination, index=0, total=1):
             "--port2",
             str(port2),
             "--user2",
-            destination["email"],
-            "--password2",
-            destination["senha"],
+            destination.email,
         ]
     )
 
     # Adicionar SSL se necessário
-    if use_ssl2:
+    if destination.use_ssl:
         cmd.append("--ssl2")
 
     # Opções adicionais
-    cmd.extend(
-        [
-            "--syncinternaldates",  # Preservar datas internas
-            "--syncacls",  # Sincronizar ACLs
-            "--subscribe",  # Inscrever nas pastas
-            "--nofoldersizes",  # Não calcular tamanhos (mais rápido)
-            "--useheader",
-            "Message-Id",  # Evitar duplicatas
-            "--useheader",
-            "Date",
-            "--skipsize",  # Pular verificação de tamanho
-            "--allowsizemismatch",  # Permitir diferenças de tamanho
-            "--no-modulesversion",  # Não verificar versões de módulos
-            "--noreleasecheck",  # Não verificar novas versões
-        ]
-    )
+    cmd += _COMMON_OPTS
+    cmd += ("--buffersize", str(source.buffersize))  # Leituras maiores por chamada
+
+    gmail1 = source.is_gmail
+    gmail2 = destination.is_gmail
+    if gmail1:
+        cmd.append("--gmail1")
+    if gmail2:
+        cmd.append("--gmail2")
+    if gmail1 and gmail2:
+        cmd.append("--synclabels")  # Sincronizar marcadores entre contas Gmail
+    if not (gmail1 or gmail2):
+        # No Gmail o cache causa ressincronizações sem fim
+        cmd.append("--usecache")
+
+    if source.allow_size_mismatch or destination.allow_size_mismatch:
+        cmd += _SIZE_MISMATCH_OPTS
+
+    return cmd
+
+
+def transfer_emails(
+    source,
+    destination,
+    cmd,
+    index=0,
+    total=1,
+    imapsync_log=None,
+    passthrough_output=False,
+):
+    """
+    Transfere emails entre duas contas usando imapsync
+
+    Args:
+        source: Endpoint da conta de origem
+        destination: Endpoint da conta de destino
+        cmd: Comando montado por _build_cmd
+        index: Índice da transferência atual
+        total: Total de transferências
+        imapsync_log: Arquivo com a saída completa do imapsync
+            (padrão: logs/imapsync_<índice>.log)
+        passthrough_output: Se verdadeiro, a saída do imapsync vai direto para o
+            terminal e o próprio imapsync grava imapsync_log
+    """
+    logger.info(_BAR)
+    logger.info(f"Iniciando transferência {index + 1}/{total}")
+    logger.info(f"Origem: {source.email}")
+    logger.info(f"Destino: {destination.email}")
+    logger.info(_BAR)
+
+    host1 = source.host
+    host2 = destination.host
+    port1 = source.imap_port
+    port2 = destination.imap_port
+
+    logger.info(f"Servidor origem: {host1}:{port1} (SSL: {source.use_ssl})")
+    logger.info(f"Servidor destino: {host2}:{port2} (SSL: {destination.use_ssl})")
+
+    cmd = list(cmd)
+    if imapsync_log is None:
+        imapsync_log = LOG_DIR / f"imapsync_{index + 1}.log"
 
+    password_fds = []
     try:
+        # Senhas entregues por pipes herdados pelo imapsync: ficam fora da linha
+        # de comando (visível no ps) e nunca são gravadas em arquivo
+        password_fds.append(_password_pipe(source.senha))
+        password_fds.append(_password_pipe(destination.senha))
+        cmd += (
+            "--passfile1",
+            f"/dev/fd/{password_fds[0]}",
+            "--passfile2",
+            f"/dev/fd/{password_fds[1]}",
+        )
+
         logger.info("Executando imapsync...")
         logger.info(f"Comando: imapsync (senha omitida por segurança)")
 
         # Executar o comando
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            bufsize=1,
-            universal_newlines=True,
-        )
-
-        # Ler output em tempo real
-        for line in process.stdout:
-            line = line.strip()
-            if line:
-                logger.info(f"imapsync: {line}")
-
-        # Aguardar conclusão
-        return_code = process.wait()
-
-        # Capturar stderr se houver
-        stderr_output = process.stderr.read()
-        if stderr_output:
-            logger.warning(f"Avisos/Erros: {stderr_output}")
+        logger.info(f"Log do imapsync: {imapsync_log}")
+        if passthrough_output:
+            # Saída herdada do processo pai; o próprio imapsync grava seu log
+            cmd += [
+                "--logdir",
+                str(imapsync_log.parent),
+                "--logfile",
+                imapsync_log.name,
+            ]
+            return_code = subprocess.run(
+                cmd, check=False, pass_fds=password_fds
+            ).returncode
+        else:
+            return_code = _run_piped(cmd, imapsync_log, password_fds)
 
         if return_code == 0:
             logger.info("✓ Transferência concluída com sucesso!")
             return True
         else:
-            logger.error("=" * 80)
+            logger.error(_BAR)
             logger.error("✗ ERRO NA TRANSFERÊNCIA")
-            logger.error(f"Email origem: {source['email']}")
-            logger.error(f"Email destino: {destination['email']}")
+            logger.error(f"Email origem: {source.email}")
+            logger.error(f"Email destino: {destination.email}")
             logger.error(f"Servidor origem: {host1}:{port1}")
             logger.error(f"Servidor destino: {host2}:{port2}")
             logger.error(f"Código de saída: {return_code}")
-            logger.error("=" * 80)
+            logger.error(_BAR)
             return False
 
     except subprocess.TimeoutExpired:
-        logger.error("=" * 80)
+        logger.error(_BAR)
         logger.error("✗ TIMEOUT NA TRANSFERÊNCIA")
-        logger.error(f"Email origem: {source['email']}")
-        logger.error(f"Email destino: {destination['email']}")
+        logger.error(f"Email origem: {source.email}")
+        logger.error(f"Email destino: {destination.email}")
         logger.error("O processo demorou muito tempo para responder")
-        logger.error("=" * 80)
+        logger.error(_BAR)
         return False
     except Exception as e:
-        logger.error("=" * 80)
+        logger.error(_BAR)
         logger.error("✗ EXCEÇÃO DURANTE TRANSFERÊNCIA")
-        logger.error(f"Email origem: {source['email']}")
-        logger.error(f"Email destino: {destination['email']}")
+        logger.error(f"Email origem: {source.email}")
+        logger.error(f"Email destino: {destination.email}")
         logger.error(f"Erro: {e}")
-        logger.error("=" * 80)
+        logger.error(_BAR)
         return False
+    finally:
+        for fd in password_fds:
+            os.close(fd)
+
+
+def _init_worker(log_prefix, total, passthrough_output, stop_event):
+    """Inicializador dos processos worker do pool"""
+    _worker_options.update(
+        log_prefix=log_prefix,
+        total=total,
+        passthrough_output=passthrough_output,
+        stop_event=stop_event,
+    )
+
 
+def _run_one(cmd, index, source, destination):
+    """Executa uma transferência no worker, com arquivo de log próprio por conta"""
+    # Contas já entregues ao worker quando a execução foi interrompida
+    if _worker_options["stop_event"].is_set():
+        return False
+    log_prefix = _worker_options["log_prefix"]
+    listener = setup_logging(
+        LOG_DIR / f"{log_prefix}_{index + 1}.log", f"[conta {index + 1}] "
+    )
+    imapsync_log = LOG_DIR / f"{log_prefix}_{index + 1}_imapsync.log"
+    try:
+        return transfer_emails(
+            source,
+            destination,
+            cmd,
+            index,
+            _worker_options["total"],
+            imapsync_log,
+            _worker_options["passthrough_output"],
+        )
+    finally:
+        stop_logging(listener)
 
-def main():
+
+def _failed_entry(index, source_email, destination_email, error):
+    """Monta o registro de uma conta que falhou para o resumo final"""
+    return {
+        "index": index + 1,
+        "source": source_email or "N/A",
+        "destination": destination_email or "N/A",
+        "error": error,
+    }
+
+
+def parse_args(argv=None):
+    """Lê os argumentos de linha de comando"""
+    parser = argparse.ArgumentParser(
+        description="Transfere emails entre contas usando imapsync"
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help=(
+            "Número de transferências simultâneas "
+            f"(padrão: min({DEFAULT_MAX_JOBS}, total de contas))"
+        ),
+    )
+    parser.add_argument(
+        "--passthrough-output",
+        action="store_true",
+        help=(
+            "Envia a saída do imapsync direto para o terminal, sem passar pelo "
+            "logging do Python; o log do imapsync é gravado pelo próprio imapsync. "
+            "Processa uma conta por vez, para não misturar a saída de várias contas"
+        ),
+    )
+    parser.add_argument(
+        "--verbose-version",
+        action="store_true",
+        help="Executa 'imapsync --version' no início e registra a versão no log",
+    )
+    parser.add_argument(
+        "--preflight",
+        action="store_true",
+        help=(
+            "Testa a conexão com cada servidor IMAP antes das transferências e "
+            "marca como falha as contas de servidores inacessíveis"
+        ),
+    )
+    args = parser.parse_args(argv)
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs deve ser maior ou igual a 1")
+    if args.passthrough_output:
+        # Vários imapsync escrevendo no mesmo terminal embaralham as linhas
+        if args.jobs is not None and args.jobs > 1:
+            parser.error("--passthrough-output não pode ser usado com --jobs > 1")
+        args.jobs = 1
+    return args
+
+
+def main(argv=None):
     """Função principal"""
-    logger.info("=" * 80)
+    args = parse_args(argv)
+    listener = setup_logging(log_filename)
+    try:
+        run_transfers(args)
+    finally:
+        stop_logging(listener)
+
+
+def run_transfers(args):
+    """Verifica o ambiente, transfere todas as contas e mostra o resumo"""
+    logger.info(_BAR)
     logger.info("INICIANDO SCRIPT DE TRANSFERÊNCIA DE EMAILS")
-    logger.info(f"Data/Hora: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}")
+    logger.info(f"Data/Hora: {started_at.strftime('%d/%m/%Y %H:%M:%S')}")
     logger.info(f"Arquivo de log: {log_filename}")
-    logger.info("=" * 80)
+    logger.info(_BAR)
 
     # Verificar se imapsync está instalado
-    if not check_imapsync_installed():
+    imapsync_path = check_imapsync_installed(args.verbose_version)
+    if not imapsync_path:
         logger.error("Por favor, instale o imapsync antes de continuar")
         logger.info("macOS: brew install imapsync")
         logger.info(
@@ -259,86 +778,99 @@ def main():
         logger.error("Não foi possível carregar as contas de email")
         sys.exit(1)
 
-    # Estatísticas
+    # Validar todas as contas antes de iniciar as transferências
     total_accounts = len(accounts)
-    success_count = 0
-    failed_count = 0
+    valid_accounts, failed_accounts = validate_accounts(accounts)
 
-    # Processar cada conta
-    failed_accounts = []  # Lista para armazenar contas que falharam
+    # Testar cada servidor uma única vez, em vez de uma vez por conta
+    if valid_accounts and args.preflight:
+        valid_accounts, unreachable = check_servers(valid_accounts)
+        failed_accounts.extend(unreachable)
 
-    for idx, account in enumerate(accounts):
+    # Estatísticas
+    success_count = 0
+    failed_count = len(failed_accounts)
+
+    # Processar as contas em paralelo
+    jobs = args.jobs or min(DEFAULT_MAX_JOBS, max(len(valid_accounts), 1))
+    logger.info(f"Transferências simultâneas: {jobs}")
+
+    # "spawn" em vez de fork: a thread do QueueListener já está rodando e um
+    # processo criado por fork poderia herdar um lock de logging travado
+    mp_context = multiprocessing.get_context("spawn")
+    stop_event = mp_context.Event()
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        mp_context=mp_context,
+        initializer=_init_worker,
+        initargs=(
+            log_filename.stem,
+            total_accounts,
+            args.passthrough_output,
+            stop_event,
+        ),
+    ) as executor:
+        futures = {}
         try:
-            source = account.get("from")
-            destination = account.get("to")
-
-            if not source or not destination:
-                logger.warning(f"Conta {idx + 1} com dados incompletos, pulando...")
-                failed_count += 1
-                failed_accounts.append(
-                    {
-                        "index": idx + 1,
-                        "source": source.get("email", "N/A") if source else "N/A",
-                        "destination": (
-                            destination.get("email", "N/A") if destination else "N/A"
-                        ),
-                        "error": "Dados incompletos no JSON",
-                    }
-                )
-                continue
-
-            # Realizar transferência
-            success = transfer_emails(source, destination, idx, total_accounts)
-
-            if success:
-                success_count += 1
-            else:
-                failed_count += 1
-                failed_accounts.append(
-                    {
-                        "index": idx + 1,
-                        "source": source.get("email", "N/A"),
-                        "destination": destination.get("email", "N/A"),
-                        "error": "Falha na transferência (veja logs acima)",
-                    }
-                )
-
-        except Exception as e:
-            logger.error("=" * 80)
-            logger.error(f"✗ ERRO AO PROCESSAR CONTA {idx + 1}")
-            if source:
-                logger.error(f"Email origem: {source.get('email', 'N/A')}")
-            if destination:
-                logger.error(f"Email destino: {destination.get('email', 'N/A')}")
-            logger.error(f"Erro: {e}")
-            logger.error("=" * 80)
-            failed_count += 1
-            failed_accounts.append(
-                {
-                    "index": idx + 1,
-                    "source": source.get("email", "N/A") if source else "N/A",
-                    "destination": (
-                        destination.get("email", "N/A") if destination else "N/A"
-                    ),
-                    "error": str(e),
-                }
-            )
+            for idx, source, destination in valid_accounts:
+                cmd = _build_cmd(source, destination, imapsync_path)
+                future = executor.submit(_run_one, cmd, idx, source, destination)
+                futures[future] = (idx, source, destination)
+
+            for future in as_completed(futures):
+                idx, source, destination = futures[future]
+                try:
+                    success = future.result()
+                except Exception as e:
+                    logger.error(_BAR)
+                    logger.error(f"✗ ERRO AO PROCESSAR CONTA {idx + 1}")
+                    logger.error(f"Email origem: {source.email}")
+                    logger.error(f"Email destino: {destination.email}")
+                    logger.error(f"Erro: {e}")
+                    logger.error(_BAR)
+                    failed_count += 1
+                    failed_accounts.append(
+                        _failed_entry(idx, source.email, destination.email, str(e))
+                    )
+                    continue
+
+                if success:
+                    success_count += 1
+                    logger.info(f"✓ Conta {idx + 1}/{total_accounts} concluída")
+                else:
+                    failed_count += 1
+                    failed_accounts.append(
+                        _failed_entry(
+                            idx,
+                            source.email,
+                            destination.email,
+                            f"Falha na transferência (veja {log_filename.stem}_{idx + 1}.log)",
+                        )
+                    )
+        except KeyboardInterrupt:
+            # Sem isso, o shutdown do pool ainda executaria as contas na fila
+            stop_event.set()
+            for future in futures:
+                future.cancel()
+            raise
+
+    failed_accounts.sort(key=lambda failed: failed["index"])
 
     # Resumo final
-    logger.info("=" * 80)
+    logger.info(_BAR)
     logger.info("RESUMO DA TRANSFERÊNCIA")
     logger.info(f"Total de contas: {total_accounts}")
     logger.info(f"Transferências bem-sucedidas: {success_count}")
     logger.info(f"Transferências com falha: {failed_count}")
     logger.info(f"Log salvo em: {log_filename}")
-    logger.info("=" * 80)
+    logger.info(_BAR)
 
     # Mostrar detalhes das contas que falharam
     if failed_accounts:
         logger.error("")
-        logger.error("=" * 80)
+        logger.error(_BAR)
         logger.error("CONTAS QUE FALHARAM:")
-        logger.error("=" * 80)
+        logger.error(_BAR)
         for failed in failed_accounts:
             logger.error(f"")
             logger.error(f"Conta #{failed['index']}:")
@@ -346,7 +878,7 @@ def main():
             logger.error(f"  Destino: {failed['destination']}")
             logger.error(f"  Motivo: {failed['error']}")
         logger.error("")
-        logger.error("=" * 80)
+        logger.error(_BAR)
 
     if failed_count > 0:
         sys.exit(1)